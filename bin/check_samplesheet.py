@@ -3,28 +3,26 @@
 
 """Provide a command line tool to validate and transform tabular samplesheets."""
 
-import os
-import argparse
-import csv
 import logging
 import sys
-from collections import Counter
 from pathlib import Path
 
 logger = logging.getLogger()
 
+DEFAULT_LOG_LEVEL = "WARNING"
+
 
 class RowChecker:
     """
-    Define a service that can validate and transform each given row.
+    Define a service that can validate and transform the rows of a samplesheet column by column.
 
     Attributes:
-        modified (list): A list of dicts, where each dict corresponds to a previously
+        modified (list): A list of lists, where each list corresponds to a previously
             validated and transformed row. The order of rows is maintained.
 
     """
 
-    VALID_FORMATS = ".RCC"
+    VALID_FORMATS = (".RCC",)
 
     def __init__(
         self,
@@ -42,14 +40,17 @@ class RowChecker:
 
         Args:
             sample_col (str): The name of the column that contains the sample name
-                (default "sample").
-            first_col (str): The name of the column that contains the first (or only)
-                FASTQ file path (default "fastq_1").
-            second_col (str): The name of the column that contains the second (if any)
-                FASTQ file path (default "fastq_2").
-            single_col (str): The name of the new column that will be inserted and
-                records whether the sample contains single- or paired-end sequencing
-                reads (default "single_end").
+                (default "SAMPLE_ID").
+            rcc_file (str): The name of the column that contains the RCC file path
+                (default "RCC_FILE").
+            rcc_file_name (str): The name of the column that contains the RCC file name;
+                it is derived from the RCC file path when empty or missing
+                (default "RCC_FILE_NAME").
+            time (str): The name of the time point column (default "TIME").
+            treatment (str): The name of the treatment column (default "TREATMENT").
+            include (str): The name of the inclusion flag column (default "INCLUDE").
+            other (str): The name of the free-form metadata column
+                (default "OTHER_METADATA").
 
         """
         super().__init__(**kwargs)
@@ -60,104 +61,133 @@ class RowChecker:
         self._treatment = treatment
         self._include = include
         self._other = other
-        self._seen = set()
+        self._sample_i = None
+        self._rcc_i = None
+        self._name_i = None
+        self._has_name = False
+        self._num_columns = None
         self.modified = []
 
-    def validate_and_transform(self, row):
+    def bind_header(self, header):
         """
-        Perform all validations on the given row and insert the read pairing status.
+        Look up the positions of the expected columns once for all following rows.
+
+        If the RCC file name column is missing, it is expected to be appended to each row.
 
         Args:
-            row (dict): A mapping from column headers (keys) to elements of that row
-                (values).
+            header (list): The column names of the samplesheet in their given order.
 
         """
-        self._validate_sample(row)
-        self._validate_rcc_file(row)
-        self._seen.add((row[self._sample_col], row[self._rcc_file], row[self._rcc_file_name]))
-        self.modified.append(row)
-
-    def _validate_sample(self, row):
-        """Assert that the sample name exists and convert spaces to underscores."""
-        if len(row[self._sample_col]) <= 0:
-            raise AssertionError("Sample input is required.")
-        # Sanitize samples slightly.
-        row[self._sample_col] = row[self._sample_col].replace(" ", "_")
-
-    def _validate_rcc_file(self, row):
-        """Assert that the RCC entry is non-empty and has the right format."""
-        if len(row[self._rcc_file]) <= 0:
-            raise AssertionError("RCC file is required.")
-        self._validate_rcc_format(row[self._rcc_file])
-
-        if self._rcc_file_name not in row:
-            row[self._rcc_file_name] = os.path.basename(row[self._rcc_file])
-        elif len(row[self._rcc_file_name]) <= 0:
-            row[self._rcc_file_name] = os.path.basename(row[self._rcc_file])
-
-    def _validate_first(self, row):
-        """Assert that the first FASTQ entry is non-empty and has the right format."""
-        if len(row[self._first_col]) <= 0:
-            raise AssertionError("At least the first FASTQ file is required.")
-        self._validate_fastq_format(row[self._first_col])
-
-    def _validate_second(self, row):
-        """Assert that the second FASTQ entry has the right format if it exists."""
-        if len(row[self._second_col]) > 0:
-            self._validate_fastq_format(row[self._second_col])
-
-    def _validate_pair(self, row):
-        """Assert that read pairs have the same file extension. Report pair status."""
-        if row[self._first_col] and row[self._second_col]:
-            row[self._single_col] = False
-            first_col_suffix = Path(row[self._first_col]).suffixes[-2:]
-            second_col_suffix = Path(row[self._second_col]).suffixes[-2:]
-            if first_col_suffix != second_col_suffix:
-                raise AssertionError("FASTQ pairs must have the same file extensions.")
-        else:
-            row[self._single_col] = True
-
-    def _validate_fastq_format(self, filename):
-        """Assert that a given filename has one of the expected FASTQ extensions."""
-        if not any(filename.endswith(extension) for extension in self.VALID_FORMATS):
-            raise AssertionError(
-                f"The FASTQ file has an unrecognized extension: {filename}\n"
-                f"It should be one of: {', '.join(self.VALID_FORMATS)}"
-            )
+        self._num_columns = len(header)
+        self._sample_i = header.index(self._sample_col)
+        self._rcc_i = header.index(self._rcc_file)
+        self._has_name = self._rcc_file_name in header
+        self._name_i = header.index(self._rcc_file_name) if self._has_name else len(header)
+
+    def validate_and_transform(self, rows):
+        """
+        Perform all validations on the given rows and fill in the RCC file names.
+
+        Rows shorter than the header are padded in place with empty values, while longer
+        rows are invalid. Each column is then checked in its own pass over all rows. The
+        sample name and RCC file are required, and the RCC file must have one of the
+        ``VALID_FORMATS``. The combination of sample name, RCC file, and RCC file name must
+        be unique among the given rows. Only if all rows are valid, they are transformed in
+        place and appended to ``modified``.
+
+        Args:
+            rows (list): A list of rows, each a list of elements in the order of the header
+                columns given to ``bind_header``.
+
+        Returns:
+            list: An ``(index, message)`` tuple for every error found, ordered by ``index``,
+            the position of the invalid row in ``rows``. Empty if all rows are valid.
 
-    def _validate_rcc_format(self, filename):
-        """Assert that a given filename has one of the expected RCC extensions."""
-        if not any(filename.endswith(extension) for extension in self.VALID_FORMATS):
-            raise AssertionError(
-                f"The RCC file has an unrecognized extension: {filename}\n"
-                f"It should be one of: {', '.join(self.VALID_FORMATS)}"
+        """
+        errors = []
+        # Treat missing trailing values as empty, but reject extra ones.
+        for i, row in enumerate(rows):
+            if len(row) < self._num_columns:
+                row.extend([""] * (self._num_columns - len(row)))
+            elif len(row) > self._num_columns:
+                errors.append((i, f"The row has {len(row)} fields but the header only {self._num_columns}."))
+        samples = [row[self._sample_i] for row in rows]
+        errors.extend((i, "Sample input is required.") for i, sample in enumerate(samples) if len(sample) <= 0)
+        # Sanitize samples slightly; most names have no spaces and can be kept as they are.
+        samples = [sample.replace(" ", "_") if " " in sample else sample for sample in samples]
+
+        rcc_files = [row[self._rcc_i] for row in rows]
+        errors.extend((i, "RCC file is required.") for i, rcc_file in enumerate(rcc_files) if len(rcc_file) <= 0)
+        errors.extend(
+            (
+                i,
+                f"The RCC file has an unrecognized extension: {rcc_file}\n"
+                f"It should be one of: {', '.join(self.VALID_FORMATS)}",
             )
+            for i, rcc_file in enumerate(rcc_files)
+            if len(rcc_file) > 0 and not rcc_file.endswith(self.VALID_FORMATS)
+        )
+
+        # Equivalent to `os.path.basename` for the POSIX paths given to the pipeline.
+        if self._has_name:
+            names = [
+                name if len(name) > 0 else rcc_file.rpartition("/")[2]
+                for name, rcc_file in zip((row[self._name_i] for row in rows), rcc_files)
+            ]
+        else:
+            names = [rcc_file.rpartition("/")[2] for rcc_file in rcc_files]
+
+        keys = list(zip(samples, rcc_files, names))
+        if len(set(keys)) != len(keys):
+            # Only look for the repeated rows when there are any.
+            seen = set()
+            for i, key in enumerate(keys):
+                if key in seen:
+                    errors.append((i, "The combination of sample name, RCC file, and RCC file name must be unique."))
+                seen.add(key)
+
+        if errors:
+            # Errors of the same row keep the column order.
+            errors.sort(key=lambda error: error[0])
+            return errors
+        for row, sample, name in zip(rows, samples, names):
+            row[self._sample_i] = sample
+            if self._has_name:
+                row[self._name_i] = name
+            else:
+                row.append(name)
+        self.modified.extend(rows)
+        return errors
 
     def validate_unique_samples(self):
         """
-        Assert that the combination of sample name and FASTQ filename is unique.
+        Rename repeated samples to have a suffix of _T{n}, where n counts the occurrences of the same sample so far.
 
-        In addition to the validation, also rename all samples to have a suffix of _T{n}, where n is the
-        number of times the same sample exist, but with different FASTQ files, e.g., multiple runs per experiment.
+        Samples are repeated with different RCC files, e.g., multiple runs per experiment. Samples that occur
+        only once keep their name. Uniqueness of the rows is already asserted by ``validate_and_transform``.
 
         """
-        if len(self._seen) != len(self.modified):
-            raise AssertionError("The pair of sample name and FASTQ must be unique.")
-        seen = Counter()
+        counts = {}
+        for row in self.modified:
+            sample = row[self._sample_i]
+            counts[sample] = counts.get(sample, 0) + 1
+        seen = {}
         for row in self.modified:
-            sample = row[self._sample_col]
-            seen[sample] += 1
-            row[self._sample_col] = f"{sample}_T{seen[sample]}"
+            sample = row[self._sample_i]
+            if counts[sample] > 1:
+                seen[sample] = seen.get(sample, 0) + 1
+                row[self._sample_i] = f"{sample}_T{seen[sample]}"
 
 
-def read_head(handle, num_lines=10):
-    """Read the specified number of lines from the current position in the file."""
-    lines = []
-    for idx, line in enumerate(handle):
-        if idx == num_lines:
-            break
-        lines.append(line)
-    return "".join(lines)
+def read_head(handle, size=65536):
+    """Read at most ``size`` characters of whole lines from the current position in the file."""
+    head = handle.read(size)
+    if len(head) == size:
+        # Drop a trailing partial line unless the window holds nothing else.
+        end = head.rfind("\n")
+        if end >= 0:
+            head = head[: end + 1]
+    return head
 
 
 def sniff_format(handle):
@@ -175,10 +205,12 @@ def sniff_format(handle):
         https://docs.python.org/3/glossary.html#term-text-file
 
     """
+    import csv
+
     peek = read_head(handle)
     handle.seek(0)
     sniffer = csv.Sniffer()
-    dialect = sniffer.sniff(peek)
+    dialect = sniffer.sniff(peek, delimiters=",;\t|")
     return dialect
 
 
@@ -191,6 +223,10 @@ def check_samplesheet(file_in, file_out):
     Args:
         file_in (pathlib.Path): The given tabular samplesheet. The format can be either
             CSV, TSV, or any other format automatically recognized by ``csv.Sniffer``.
+            Files ending in ``.csv`` or ``.tsv`` are first read as comma- or tab-separated,
+            ignoring spaces after delimiters. Only if their header then lacks the required
+            columns, e.g., in a semicolon-separated export, is the format sniffed as it is
+            for any other file.
         file_out (pathlib.Path): Where the validated and transformed samplesheet should
             be created; always in CSV format.
 
@@ -200,36 +236,63 @@ def check_samplesheet(file_in, file_out):
             'RCC_FILE','RCC_FILE_NAME','SAMPLE_ID','TIME','TREATMENT','INCLUDE','OTHER_METADATA'
 
     """
-    required_columns = {"RCC_FILE", "SAMPLE_ID"}
+    import csv
+
+    required_columns = ("RCC_FILE", "SAMPLE_ID")
     # See https://docs.python.org/3.9/library/csv.html#id3 to read up on `newline=""`.
-    with file_in.open(newline="") as in_handle:
-        reader = csv.DictReader(in_handle, dialect=sniff_format(in_handle))
+    with file_in.open(newline="", buffering=1 << 20) as in_handle:
+        dialect = {".csv": csv.excel, ".tsv": csv.excel_tab}.get(file_in.suffix.lower())
+        fieldnames = []
+        if dialect is not None:
+            reader = csv.reader(in_handle, dialect=dialect, skipinitialspace=True)
+            fieldnames = next(reader, [])
+        if dialect is None or any(column not in fieldnames for column in required_columns):
+            in_handle.seek(0)
+            try:
+                sniffed = sniff_format(in_handle)
+            except csv.Error:
+                # Report the missing columns of the header read according to the suffix.
+                if dialect is None:
+                    raise
+            else:
+                reader = csv.reader(in_handle, dialect=sniffed)
+                fieldnames = next(reader, [])
         # Validate the existence of the expected header columns.
-        if not required_columns.issubset(reader.fieldnames):
+        missing = [column for column in required_columns if column not in fieldnames]
+        if missing:
             req_cols = ", ".join(required_columns)
-            logger.critical(f"The sample sheet **must** contain these column headers: {req_cols}.")
+            logger.critical(
+                f"The sample sheet **must** contain these column headers: {req_cols}. Missing: {', '.join(missing)}."
+            )
             sys.exit(1)
-        # Validate each row.
-        checker = RowChecker()
-        for i, row in enumerate(reader):
-            try:
-                checker.validate_and_transform(row)
-            except AssertionError as error:
-                logger.critical(f"{str(error)} On line {i + 2}.")
-                sys.exit(1)
-    header = list(reader.fieldnames)
-    if "RCC_FILE_NAME" not in list(reader.fieldnames):
-        header.append("RCC_FILE_NAME")
+        header = fieldnames if "RCC_FILE_NAME" in fieldnames else fieldnames + ["RCC_FILE_NAME"]
+        # Parse all records up front, skipping empty lines like `csv.DictReader`, and
+        # remember their line numbers for error messages.
+        rows = []
+        line_nums = []
+        for row in reader:
+            if row:
+                rows.append(row)
+                line_nums.append(reader.line_num)
+    # Validate all rows.
+    checker = RowChecker()
+    checker.bind_header(fieldnames)
+    errors = checker.validate_and_transform(rows)
+    if errors:
+        for index, message in errors:
+            logger.critical(f"{message} On line {line_nums[index]}.")
+        sys.exit(1)
     # See https://docs.python.org/3.9/library/csv.html#id3 to read up on `newline=""`.
-    with file_out.open(mode="w", newline="") as out_handle:
-        writer = csv.DictWriter(out_handle, header, delimiter=",")
-        writer.writeheader()
-        for row in checker.modified:
-            writer.writerow(row)
+    with file_out.open(mode="w", newline="", buffering=1 << 20) as out_handle:
+        writer = csv.writer(out_handle, delimiter=",")
+        writer.writerow(header)
+        writer.writerows(checker.modified)
 
 
 def parse_args(argv=None):
     """Define and immediately parse command line arguments."""
+    import argparse
+
     parser = argparse.ArgumentParser(
         description="Validate and transform a tabular samplesheet.",
         epilog="Example: python check_samplesheet.py samplesheet.csv samplesheet.valid.csv",
@@ -249,22 +312,30 @@ def parse_args(argv=None):
     parser.add_argument(
         "-l",
         "--log-level",
-        help="The desired log level (default WARNING).",
+        help=f"The desired log level (default {DEFAULT_LOG_LEVEL}).",
         choices=("CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG"),
-        default="WARNING",
+        default=DEFAULT_LOG_LEVEL,
     )
     return parser.parse_args(argv)
 
 
 def main(argv=None):
     """Coordinate argument parsing and program execution."""
-    args = parse_args(argv)
-    logging.basicConfig(level=args.log_level, format="[%(levelname)s] %(message)s")
-    if not args.file_in.is_file():
-        logger.error(f"The given input file {args.file_in} was not found!")
+    if argv is None:
+        argv = sys.argv[1:]
+    # The pipeline only passes the two file paths, which need no argument parser.
+    if len(argv) == 2 and not any(arg.startswith("-") for arg in argv):
+        file_in, file_out = Path(argv[0]), Path(argv[1])
+        log_level = DEFAULT_LOG_LEVEL
+    else:
+        args = parse_args(argv)
+        file_in, file_out, log_level = args.file_in, args.file_out, args.log_level
+    logging.basicConfig(level=log_level, format="[%(levelname)s] %(message)s")
+    if not file_in.is_file():
+        logger.error(f"The given input file {file_in} was not found!")
         sys.exit(2)
-    args.file_out.parent.mkdir(parents=True, exist_ok=True)
-    check_samplesheet(args.file_in, args.file_out)
+    file_out.parent.mkdir(parents=True, exist_ok=True)
+    check_samplesheet(file_in, file_out)
 
 
 if __name__ == "__main__":